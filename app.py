@@ -1,66 +1,80 @@
 import keep_alive  # Add this at the very top
+from datetime import datetime
 from flask import Flask
+from flask_apscheduler import APScheduler
 import threading
 import time
 import logging
 import os
-from twitter_bot import check_and_forward_tweets, CHECK_INTERVAL
+from twitter_bot import check_and_forward_tweets, setup_stream_rules, stream_tweets, CHECK_INTERVAL
 
 app = Flask(__name__)
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Logging (file + console) is configured once by twitter_bot on import
 logger = logging.getLogger(__name__)
 
-# Global variable to track if bot thread is running
-bot_thread_started = False
-bot_thread = None
+# The periodic check runs on APScheduler
+scheduler = APScheduler()
+scheduler.init_app(app)
 
-def bot_worker():
-    """Background thread that runs the bot"""
-    global bot_thread_started
-    bot_thread_started = True
-    logger.info("✅ Bot worker thread started successfully!")
-    
-    # Add a small delay to ensure Flask app is fully ready
-    time.sleep(2)
+# Tracks whether the stream thread is currently connected or reconnecting
+stream_active = False
+stream_thread = None
+
+@scheduler.task('interval', id='tweet_check', seconds=CHECK_INTERVAL,
+                misfire_grace_time=60, next_run_time=datetime.now())
+def tweet_check():
+    """Catch up on tweets the stream missed (startup, reconnect gaps)"""
+    logger.info("🔄 Checking for new tweets...")
+    try:
+        tweet_count = check_and_forward_tweets()
+    except Exception as e:
+        logger.error("❌ Error in tweet check: %s", e)
+        return
     
-    # Initial check immediately
-    logger.info("🔄 Performing initial tweet check...")
-    initial_count = check_and_forward_tweets()
-    logger.info(f"✅ Initial check completed. Processed {initial_count} tweets.")
+    if tweet_count > 0:
+        logger.info("✅ Processed %d new tweets", tweet_count)
+    else:
+        logger.info("✅ No new tweets found")
+
+def tweet_stream():
+    """Follow the filtered stream so new tweets are pushed as they happen"""
+    global stream_active
+    stream_active = True
+    logger.info("✅ Stream thread started successfully!")
     
-    # Then continue with regular intervals
-    while True:
-        try:
-            logger.info(f"💤 Sleeping for {CHECK_INTERVAL} seconds...")
-            time.sleep(CHECK_INTERVAL)
-            logger.info("🔄 Checking for new tweets...")
-            tweet_count = check_and_forward_tweets()
-            if tweet_count > 0:
-                logger.info(f"✅ Processed {tweet_count} new tweets")
-            else:
-                logger.info("✅ No new tweets found")
-        except Exception as e:
-            logger.error(f"❌ Error in bot worker: {e}")
-            time.sleep(60)  # Wait before retrying
+    rules_installed = False
+    try:
+        while True:
+            try:
+                if not rules_installed:
+                    rules_installed = setup_stream_rules()
+                    if not rules_installed:
+                        time.sleep(60)  # Without the rule the stream would match nothing
+                        continue
+                stream_tweets()
+                logger.warning("⚠️ Filtered stream closed, reconnecting...")
+            except Exception as e:
+                logger.error("❌ Error in stream thread: %s", e)
+                time.sleep(60)  # Wait before reconnecting
+    finally:
+        stream_active = False
 
-def start_bot_thread():
-    """Start the bot thread"""
-    global bot_thread, bot_thread_started
-    if not bot_thread_started and (bot_thread is None or not bot_thread.is_alive()):
-        logger.info("🚀 Starting bot thread...")
-        bot_thread = threading.Thread(target=bot_worker, daemon=True)
-        bot_thread.start()
-        return True
-    return False
+def start_stream_thread():
+    """Start the stream loop in a daemon thread"""
+    global stream_thread
+    # The loop never returns, so it must not run on a scheduler worker: those are
+    # joined at interpreter exit and would block shutdown until SIGKILL
+    stream_thread = threading.Thread(target=tweet_stream, daemon=True)
+    stream_thread.start()
 
-# Start the bot thread when the app imports this module
-start_bot_thread()
+# Start the scheduler and stream when the app imports this module
+scheduler.start()
+start_stream_thread()
 
 @app.route('/')
 def home():
-    return "Twitter-to-Telegram Bot is running! Bot thread should be active."
+    return "Twitter-to-Telegram Bot is running! Bot jobs should be active."
 
 @app.route('/health')
 def health():
@@ -68,31 +82,31 @@ def health():
 
 @app.route('/bot-status')
 def bot_status():
-    """Check if bot thread is running"""
-    global bot_thread_started, bot_thread
-    status = f"Bot thread started: {bot_thread_started}"
-    if bot_thread:
-        status += f", Alive: {bot_thread.is_alive()}"
+    """Check if the scheduler and stream thread are running"""
+    status = f"Scheduler running: {scheduler.running}, Stream active: {stream_active}"
+    check_job = scheduler.get_job('tweet_check')
+    if check_job:
+        status += f", Next check: {check_job.next_run_time}"
     return status
 
-@app.route('/trigger-check')
-def manual_start():
-    """Manually start the bot thread"""
-    if start_bot_thread():
-        return "Bot thread started manually!"
-    return "Bot thread already running or starting..."
+@app.route('/start-bot')
+def start_bot():
+    """Manually restart the stream thread if it has stopped"""
+    if stream_thread and stream_thread.is_alive():
+        return "Stream thread already running..."
+    start_stream_thread()
+    return "Stream thread started manually!"
 
 @app.route('/trigger-check')
 def trigger_check():
     """Manually trigger a tweet check"""
     try:
-        result = check_and_forward_tweets()
-        return f"Manual check completed. Processed {result} tweets."
+        scheduler.get_job('tweet_check').modify(next_run_time=datetime.now())
+        return "Manual check scheduled to run now."
     except Exception as e:
         return f"Error during manual check: {e}"
 
 # For Koyeb deployment
 if __name__ == '__main__':
-    start_bot_thread()
     port = int(os.environ.get('PORT', 8000))
     app.run(host='0.0.0.0', port=port)
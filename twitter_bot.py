@@ -1,10 +1,25 @@
 import os
+import fcntl
+import hashlib
 import time
 import logging
 import requests
 import re
+import orjson
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 import telebot
+from telebot.apihelper import ApiTelegramException
+from telebot.types import InputMediaPhoto, InputMediaVideo
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
 
 # Load environment variables
 load_dotenv()
@@ -17,26 +32,65 @@ TWITTER_TARGET_USER = "AboutNodKrai"
 CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', 900))
 MAX_TWEETS_PER_CHECK = int(os.getenv('MAX_TWEETS_PER_CHECK', 5))
 
+# Filtered stream configuration
+STREAM_URL = "https://api.twitter.com/2/tweets/search/stream"
+STREAM_RULES_URL = f"{STREAM_URL}/rules"
+STREAM_RULE = f"from:{TWITTER_TARGET_USER} has:media -is:retweet -is:reply"
+STREAM_RULE_TAG = "media-tweets"
+STREAM_READ_TIMEOUT = 90  # Twitter sends a keep-alive newline every ~20 seconds
+MEDIA_DOWNLOAD_WORKERS = 4  # Parallel media downloads when uploading ourselves
+MEDIA_SPOOL_SIZE = 5 * 1024 * 1024  # Downloads larger than this spill from memory to disk
+VIDEO_SIZE_LIMIT = 45 * 1024 * 1024  # Larger uploaded videos are sent as documents
+
+# Fields requested for every tweet, whether polled or streamed
+TWEET_FIELDS = {
+    "tweet.fields": "created_at,attachments,entities,text,referenced_tweets",
+    "expansions": "attachments.media_keys",
+    "media.fields": "url,type,preview_image_url,variants",
+}
+
+# Patterns stripped from tweet text, compiled once
+URL_RE = re.compile(r'https?://\S+|pic\.twitter\.com/\S+')
+WHITESPACE_RE = re.compile(r'\s+')
+
 # Get the base directory of the project
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Use PERSISTENT directories for data and logs
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
-TEMP_DIR = os.path.join(BASE_DIR, 'temp')
 
 # Create directories if they don't exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
-os.makedirs(TEMP_DIR, exist_ok=True)
 
 # Define file paths
-DATA_FILE = os.path.join(DATA_DIR, 'processed_tweets.txt')
+DB_FILE = os.path.join(DATA_DIR, 'processed.db')
+LEGACY_DATA_FILE = os.path.join(DATA_DIR, 'processed_tweets.txt')
+USER_ID_CACHE_FILE = os.path.join(DATA_DIR, 'user_ids.json')
+FILE_ID_CACHE_FILE = os.path.join(DATA_DIR, 'file_ids.json')
+LOCK_FILE = os.path.join(DATA_DIR, 'bot.lock')
 LOG_FILE = os.path.join(LOG_DIR, 'bot.log')
 
-# Rate limit tracking
-last_api_call = 0
-RATE_LIMIT_DELAY = 2  # seconds between API calls
+# Number of most recent processed tweet IDs kept in storage
+PROCESSED_HISTORY_SIZE = 500
+
+# Rate limits: Twitter API calls are spaced out, Telegram sends may burst a little
+# but stay under the ~20 messages/minute a single chat accepts
+RATE_LIMIT_DELAY = 2  # seconds between Twitter API calls
+RATE_LIMIT_MAX_WAIT = 900  # longest wait for a Twitter rate-limit window to reset
+TELEGRAM_SENDS_PER_MINUTE = 20
+TELEGRAM_BURST = 5
+
+# User IDs never change, so resolved usernames are cached for a long time
+USER_ID_CACHE_TTL = 86400  # 24 hours
+
+# Telegram file_ids of media we've already sent, so repeats skip the upload
+FILE_ID_CACHE_SIZE = 500
+
+# Timeline responses keyed by (user_id, since_id); shields /trigger-check spam
+# from spending rate-limit tokens while scheduled polls still fetch fresh data
+tweets_cache = TTLCache(maxsize=32, ttl=max(60, CHECK_INTERVAL // 2))
 
 # Validate required settings
 required_vars = [
@@ -63,178 +117,406 @@ logger = logging.getLogger(__name__)
 # Initialize Telegram bot
 telegram_bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
 
-def enforce_rate_limit():
-    """Respect Twitter API rate limits"""
-    global last_api_call
-    current_time = time.time()
-    elapsed = current_time - last_api_call
+class TwitterRetry(Retry):
+    """Retry policy that also waits out Twitter's x-rate-limit-reset on 429s"""
     
-    if elapsed < RATE_LIMIT_DELAY:
-        sleep_time = RATE_LIMIT_DELAY - elapsed
-        time.sleep(sleep_time)
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        # Wait for a rate-limit reset only once per request: a 429 that survives the
+        # reset (e.g. a usage cap) would otherwise hold the check for up to 45 minutes
+        if response is not None and response.status == 429:
+            if sum(entry.status == 429 for entry in new_retry.history) > 1:
+                raise MaxRetryError(_pool, url, ResponseError("too many 429 error responses"))
+        return new_retry
     
-    last_api_call = time.time()
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        reset = response.headers.get('x-rate-limit-reset')
+        if retry_after is None and response.status == 429 and reset:
+            retry_after = min(RATE_LIMIT_MAX_WAIT, max(0, int(reset) - time.time()))
+        return retry_after
 
-def load_processed_tweets():
-    """Load processed tweets from file"""
-    processed_tweets = set()
+# Shared HTTP session so Twitter API and media calls reuse pooled keep-alive
+# connections; transient 5xx errors are retried by the adapter with a bounded
+# backoff and a 429 is retried once (after the rate-limit reset when Twitter
+# reports one), then raise so callers give up until the next check.
+# The bearer token is passed per API call so it never reaches the media CDN.
+TWITTER_HEADERS = {"Authorization": f"Bearer {TWITTER_BEARER_TOKEN}"}
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=TwitterRetry(
+        total=3,
+        backoff_factor=60,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True
+    )
+))
+
+# Long-lived pool for fallback media downloads, reused across tweets and checks
+media_executor = ThreadPoolExecutor(max_workers=MEDIA_DOWNLOAD_WORKERS, thread_name_prefix='media')
+
+# Processed tweet IDs live in SQLite so each new ID is a single indexed insert
+db_conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+db_conn.execute('PRAGMA journal_mode=WAL')
+db_conn.execute('PRAGMA synchronous=NORMAL')
+db_lock = threading.Lock()
+
+# Newest tweet ID seen in a timeline response, used as the poll's since_id. Only
+# polls move it: streamed tweets must not, or tweets posted during a stream gap
+# would fall below since_id and never be caught up.
+last_polled_id = 0
+
+# Advisory lock so only one check runs at a time. The OS drops a flock when the
+# process dies, so a crash can never leave a stale lock behind. A flock doesn't
+# exclude threads sharing the descriptor, so a thread lock guards in-process
+# checks. Streamed tweets don't take these locks; they claim their ID in the
+# processed store instead (see save_processed_tweets).
+check_lock_fd = os.open(LOCK_FILE, os.O_CREAT | os.O_RDWR, 0o644)
+check_lock = threading.Lock()
+
+class TokenBucket:
+    """Thread-safe token bucket that only blocks once the burst capacity is spent"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def take(self, n=1):
+        """Take n tokens, sleeping until they are available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            
+            wait = (n - self.tokens) / self.rate if self.tokens < n else 0
+            self.tokens -= n
+        
+        if wait > 0:
+            time.sleep(wait)
+
+twitter_bucket = TokenBucket(rate=1 / RATE_LIMIT_DELAY, capacity=1)
+telegram_bucket = TokenBucket(rate=TELEGRAM_SENDS_PER_MINUTE / 60, capacity=TELEGRAM_BURST)
+
+def write_file_atomic(path, data):
+    """Write bytes to path via a temp file + rename, so a crash never leaves it truncated"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
     try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as f:
-                for line in f:
-                    tweet_id = line.strip()
-                    if tweet_id:  # Skip empty lines
-                        processed_tweets.add(tweet_id)
-            logger.info(f"Loaded {len(processed_tweets)} processed tweet IDs")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def parse_json_response(response):
+    """Parse a JSON response body with orjson"""
+    return orjson.loads(response.content)
+
+def init_processed_store():
+    """Create the processed-tweets table and import the legacy text file once"""
+    with db_lock, db_conn:
+        db_conn.execute('CREATE TABLE IF NOT EXISTS processed (id INTEGER PRIMARY KEY)')
+    
+    if not os.path.exists(LEGACY_DATA_FILE):
+        return
+    
+    try:
+        with open(LEGACY_DATA_FILE, 'r') as f:
+            legacy_ids = f.read().split()  # Also skips empty lines
+        save_processed_tweets(legacy_ids)
+        os.replace(LEGACY_DATA_FILE, f"{LEGACY_DATA_FILE}.migrated")
+        logger.info("Migrated %d processed tweet IDs to %s", len(legacy_ids), DB_FILE)
     except Exception as e:
-        logger.error(f"Error loading processed tweets: {e}")
-    return processed_tweets
+        logger.error("Error migrating processed tweets: %s", e)
 
-def save_processed_tweets(processed_tweets):
-    """Save processed tweets to file"""
+def load_processed_tweets(tweet_ids):
+    """Return the subset of tweet_ids that has already been processed"""
+    tweet_ids = [int(tweet_id) for tweet_id in tweet_ids]
+    if not tweet_ids:
+        return set()
+    
+    placeholders = ','.join('?' * len(tweet_ids))
     try:
-        with open(DATA_FILE, 'w') as f:
-            for tweet_id in processed_tweets:
-                f.write(f"{tweet_id}\n")
-        logger.info(f"Saved {len(processed_tweets)} tweet IDs to storage")
+        with db_lock:
+            rows = db_conn.execute(f'SELECT id FROM processed WHERE id IN ({placeholders})', tweet_ids).fetchall()
+        return {str(row[0]) for row in rows}
     except Exception as e:
-        logger.error(f"Error saving processed tweets: {e}")
+        logger.error("Error loading processed tweets: %s", e)
+        return set()
+
+def save_processed_tweets(tweet_ids):
+    """Record tweet IDs in one transaction, returning those this call newly claimed"""
+    # Claiming before sending means the stream and the poll never both forward a tweet.
+    # Database errors propagate: an empty result must only ever mean "already processed".
+    tweet_ids = [int(tweet_id) for tweet_id in tweet_ids]
+    claimed = set()
+    if not tweet_ids:
+        return claimed
+    
+    with db_lock, db_conn:
+        for tweet_id in tweet_ids:
+            if db_conn.execute('INSERT OR IGNORE INTO processed VALUES (?)', (tweet_id,)).rowcount:
+                claimed.add(str(tweet_id))
+        # Only recent IDs can come back from the API, so older history is dropped
+        db_conn.execute(
+            'DELETE FROM processed WHERE id < (SELECT id FROM processed ORDER BY id DESC LIMIT 1 OFFSET ?)',
+            (PROCESSED_HISTORY_SIZE - 1,)
+        )
+    logger.info("Saved %d tweet IDs to storage", len(claimed))
+    return claimed
+
+def load_user_id_cache():
+    """Load cached username -> (user ID, expiry) pairs from file"""
+    try:
+        if os.path.exists(USER_ID_CACHE_FILE):
+            with open(USER_ID_CACHE_FILE, 'rb') as f:
+                return {username: tuple(entry) for username, entry in orjson.loads(f.read()).items()}
+    except Exception as e:
+        logger.error("Error loading user ID cache: %s", e)
+    return {}
+
+def save_user_id_cache():
+    """Persist the user ID cache so restarts don't re-resolve usernames"""
+    try:
+        write_file_atomic(USER_ID_CACHE_FILE, orjson.dumps(user_id_cache))
+    except Exception as e:
+        logger.error("Error saving user ID cache: %s", e)
+
+def load_file_id_cache():
+    """Load cached media URL hash -> Telegram file_id pairs from file"""
+    try:
+        if os.path.exists(FILE_ID_CACHE_FILE):
+            with open(FILE_ID_CACHE_FILE, 'rb') as f:
+                return orjson.loads(f.read())
+    except Exception as e:
+        logger.error("Error loading file ID cache: %s", e)
+    return {}
+
+def save_file_id_cache():
+    """Persist the file ID cache so restarts can still reuse uploaded media"""
+    try:
+        write_file_atomic(FILE_ID_CACHE_FILE, orjson.dumps(file_id_cache))
+    except Exception as e:
+        logger.error("Error saving file ID cache: %s", e)
+
+def media_cache_key(media_url):
+    """Key a media URL for the file ID cache"""
+    return hashlib.sha1(media_url.encode()).hexdigest()
+
+def get_message_file_id(message):
+    """Return the file_id of the media attached to a sent Telegram message"""
+    if message.photo:
+        return message.photo[-1].file_id
+    for attachment in (message.video, message.animation, message.document):
+        if attachment:
+            return attachment.file_id
+    return None
+
+def remember_file_ids(media_urls, messages):
+    """Cache the file_ids Telegram assigned to freshly sent media"""
+    for media, message in zip(media_urls, messages):
+        file_id = get_message_file_id(message)
+        if file_id:
+            file_id_cache[media_cache_key(media['url'])] = file_id
+    
+    # Drop the oldest entries once the cache is full
+    while len(file_id_cache) > FILE_ID_CACHE_SIZE:
+        del file_id_cache[next(iter(file_id_cache))]
+    save_file_id_cache()
 
 def get_user_id(username):
-    """Get Twitter user ID from username"""
+    """Get Twitter user ID from username, served from cache while fresh or if the API fails"""
+    cached = user_id_cache.get(username)
+    if cached and time.time() < cached[1]:
+        return cached[0]
+    
     url = f"https://api.twitter.com/2/users/by/username/{username}"
-    headers = {"Authorization": f"Bearer {TWITTER_BEARER_TOKEN}"}
     
     try:
-        enforce_rate_limit()
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code == 429:
-            logger.warning("Rate limit hit. Waiting 15 minutes...")
-            time.sleep(900)
-            return get_user_id(username)
+        twitter_bucket.take()
+        response = http_session.get(url, headers=TWITTER_HEADERS, timeout=10)
         
         response.raise_for_status()
-        data = response.json()
-        return data['data']['id'] if 'data' in data else None
+        data = parse_json_response(response)
+        if 'data' not in data:
+            return None
+        
+        user_id_cache[username] = (data['data']['id'], time.time() + USER_ID_CACHE_TTL)
+        save_user_id_cache()
+        return data['data']['id']
+    except requests.exceptions.RetryError:
+        logger.warning("Twitter rate limit retries exhausted while fetching user ID")
+        if cached:
+            return cached[0]  # User IDs never change, so an expired entry is still right
+        raise
     except Exception as e:
-        logger.error(f"Error fetching user ID: {e}")
-        return None
+        logger.error("Error fetching user ID: %s", e)
+        return cached[0] if cached else None
 
 def get_recent_tweets(user_id, since_id=None):
-    """Get recent tweets from a user with rate limit handling"""
+    """Get recent tweets from a user, reusing a recent identical response"""
+    cache_key = (user_id, since_id)
+    if cache_key in tweets_cache:
+        logger.info("Using cached timeline response")
+        return tweets_cache[cache_key]
+    
     url = f"https://api.twitter.com/2/users/{user_id}/tweets"
-    headers = {"Authorization": f"Bearer {TWITTER_BEARER_TOKEN}"}
     
     params = {
         "max_results": MAX_TWEETS_PER_CHECK,
-        "tweet.fields": "created_at,attachments,entities,text,referenced_tweets",
-        "expansions": "attachments.media_keys",
-        "media.fields": "url,type,preview_image_url,variants",
+        **TWEET_FIELDS,
         "exclude": "retweets,replies"
     }
     
     # Add since_id parameter to get only NEW tweets
     if since_id:
         params["since_id"] = since_id
-        logger.info(f"Using since_id: {since_id} to fetch only new tweets")
+        logger.info("Using since_id: %s to fetch only new tweets", since_id)
     
     try:
-        enforce_rate_limit()
-        response = requests.get(url, headers=headers, params=params, timeout=15)
-        
-        if response.status_code == 429:
-            logger.warning("Rate limit hit. Waiting 15 minutes...")
-            time.sleep(900)
-            return get_recent_tweets(user_id, since_id)
+        twitter_bucket.take()
+        response = http_session.get(url, headers=TWITTER_HEADERS, params=params, timeout=15)
         
         response.raise_for_status()
-        return response.json()
+        tweets_data = parse_json_response(response)
+        tweets_cache[cache_key] = tweets_data
+        return tweets_data
+    except requests.exceptions.RetryError:
+        logger.warning("Twitter rate limit retries exhausted while fetching tweets")
+        raise
     except Exception as e:
-        logger.error(f"Error fetching tweets: {e}")
+        logger.error("Error fetching tweets: %s", e)
         return None
 
-def download_media(media_url, filename):
-    """Download media from URL"""
+def setup_stream_rules():
+    """Install the filtered-stream rule for the target user, replacing stale ones"""
     try:
-        response = requests.get(media_url, timeout=30)
+        response = http_session.get(STREAM_RULES_URL, headers=TWITTER_HEADERS, timeout=10)
+        response.raise_for_status()
+        existing = parse_json_response(response).get('data', [])
+        
+        if any(rule['value'] == STREAM_RULE for rule in existing):
+            logger.info("Stream rule already installed: %s", STREAM_RULE)
+            return True
+        
+        stale_ids = [rule['id'] for rule in existing if rule.get('tag') == STREAM_RULE_TAG]
+        if stale_ids:
+            response = http_session.post(STREAM_RULES_URL, headers=TWITTER_HEADERS, json={"delete": {"ids": stale_ids}}, timeout=10)
+            response.raise_for_status()
+        
+        response = http_session.post(
+            STREAM_RULES_URL,
+            headers=TWITTER_HEADERS,
+            json={"add": [{"value": STREAM_RULE, "tag": STREAM_RULE_TAG}]},
+            timeout=10
+        )
         response.raise_for_status()
-        with open(filename, 'wb') as f:
-            f.write(response.content)
+        logger.info("Installed stream rule: %s", STREAM_RULE)
         return True
     except Exception as e:
-        logger.error(f"Failed to download media: {e}")
+        logger.error("Error installing stream rules: %s", e)
         return False
 
-def send_media_to_telegram(media_path, caption=None, is_photo=True):
-    """Send media to Telegram with caption"""
+def stream_tweets():
+    """Consume the filtered stream, forwarding each matching tweet as it arrives"""
+    logger.info("Connecting to filtered stream...")
+    with http_session.get(STREAM_URL, headers=TWITTER_HEADERS, params=TWEET_FIELDS, stream=True,
+                          timeout=(10, STREAM_READ_TIMEOUT)) as response:
+        response.raise_for_status()
+        logger.info("✅ Connected to filtered stream")
+        
+        for line in response.iter_lines():
+            if not line:
+                continue  # Keep-alive heartbeat
+            
+            tweet_json = orjson.loads(line)
+            if 'data' not in tweet_json:
+                logger.warning("Unexpected stream message: %s", tweet_json)
+                continue
+            
+            # Rules are shared by every app on this bearer token; only forward our own
+            if not any(rule.get('tag') == STREAM_RULE_TAG for rule in tweet_json.get('matching_rules', [])):
+                logger.info("Skipping tweet %s matched by another stream rule", tweet_json['data']['id'])
+                continue
+            
+            forward_tweet(tweet_json)
+
+def download_media(media_url):
+    """Stream media from URL into a spooled temp file, returning it rewound or None"""
+    media_file = tempfile.SpooledTemporaryFile(max_size=MEDIA_SPOOL_SIZE)
     try:
-        with open(media_path, 'rb') as media:
-            if is_photo:
-                telegram_bot.send_photo(TELEGRAM_CHAT_ID, media, caption=caption, parse_mode='HTML')
-            else:
-                file_size = os.path.getsize(media_path)
-                if file_size > 45 * 1024 * 1024:
-                    logger.warning(f"Video too large ({file_size/1024/1024:.2f}MB), sending as document")
-                    telegram_bot.send_document(TELEGRAM_CHAT_ID, media, caption=caption, parse_mode='HTML')
-                else:
-                    telegram_bot.send_video(TELEGRAM_CHAT_ID, media, caption=caption, parse_mode='HTML')
-        return True
+        with http_session.get(media_url, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            shutil.copyfileobj(response.raw, media_file, length=65536)
+        media_file.seek(0)
+        return media_file
     except Exception as e:
-        logger.error(f"Failed to send media to Telegram: {e}")
-        return False
+        media_file.close()
+        logger.error("Failed to download media: %s", e)
+        return None
+
+def send_media_to_telegram(media_file, caption=None, is_photo=True):
+    """Upload downloaded media to Telegram with caption, returning the sent message or None"""
+    try:
+        telegram_bucket.take()
+        if is_photo:
+            return telegram_bot.send_photo(TELEGRAM_CHAT_ID, media_file, caption=caption, parse_mode='HTML')
+        
+        # Size from the open handle; os.fstat would force a spooled file onto disk
+        file_size = media_file.seek(0, os.SEEK_END)
+        media_file.seek(0)
+        if file_size > VIDEO_SIZE_LIMIT:
+            logger.warning("Video too large (%.2fMB), sending as document", file_size/1024/1024)
+            return telegram_bot.send_document(TELEGRAM_CHAT_ID, media_file, caption=caption, parse_mode='HTML')
+        return telegram_bot.send_video(TELEGRAM_CHAT_ID, media_file, caption=caption, parse_mode='HTML')
+    except Exception as e:
+        logger.error("Failed to send media to Telegram: %s", e)
+        return None
 
 def clean_tweet_text(text):
     """Clean tweet text by removing URLs and unwanted content"""
-    text = re.sub(r'http\S+', '', text)
-    text = re.sub(r'pic\.twitter\.com/\S+', '', text)
-    return re.sub(r'\s+', ' ', text).strip()
-
-def is_retweet(tweet):
-    """Check if a tweet is a retweet"""
-    if 'referenced_tweets' in tweet:
-        for ref_tweet in tweet['referenced_tweets']:
-            if ref_tweet['type'] == 'retweeted':
-                return True
-    return False
-
-def process_tweet(tweet, media_data=None):
+    return WHITESPACE_RE.sub(' ', URL_RE.sub('', text)).strip()
+
+def index_media(tweets_data):
+    """Map media_key -> media object for a response's ``includes.media``"""
+    return {media['media_key']: media for media in tweets_data.get('includes', {}).get('media', [])}
+
+def process_tweet(tweet, media_by_key=None):
     """Process a single tweet and extract relevant data"""
-    if is_retweet(tweet):
-        logger.info(f"Skipping retweet: {tweet['id']}")
-        return None
-    
     tweet_id = tweet['id']
     text = clean_tweet_text(tweet['text'])
     
     media_urls = []
-    if 'attachments' in tweet and media_data and 'includes' in media_data and 'media' in media_data['includes']:
-        media_keys = tweet['attachments']['media_keys']
-        for media_key in media_keys:
-            for media in media_data['includes']['media']:
-                if media['media_key'] == media_key:
-                    if media['type'] == 'photo':
-                        media_urls.append({
-                            'type': 'photo',
-                            'url': media['url']
-                        })
-                    elif media['type'] == 'video':
-                        best_bitrate = 0
-                        best_url = None
-                        
-                        if 'variants' in media:
-                            for variant in media['variants']:
-                                if 'bit_rate' in variant and variant['bit_rate'] > best_bitrate:
-                                    best_bitrate = variant['bit_rate']
-                                    best_url = variant['url']
-                                elif 'url' in variant and not best_url:
-                                    best_url = variant['url']
-                        
-                        if best_url:
-                            media_urls.append({
-                                'type': 'video',
-                                'url': best_url
-                            })
+    if 'attachments' in tweet and media_by_key:
+        for media_key in tweet['attachments'].get('media_keys', []):
+            media = media_by_key.get(media_key)
+            if media is None:
+                continue
+            
+            if media['type'] == 'photo':
+                media_urls.append({
+                    'type': 'photo',
+                    'url': media['url']
+                })
+            elif media['type'] == 'video':
+                # Highest-bitrate MP4 wins; HLS (.m3u8) playlists can't be fetched or played by Telegram
+                variants = [
+                    variant for variant in media.get('variants', [])
+                    if 'url' in variant and variant.get('content_type', 'video/mp4') == 'video/mp4'
+                ]
+                best = max(variants, key=lambda variant: variant.get('bit_rate', -1), default=None)
+                
+                if best:
+                    media_urls.append({
+                        'type': 'video',
+                        'url': best['url']
+                    })
     
     if not media_urls:
         return None
@@ -245,44 +527,126 @@ def process_tweet(tweet, media_data=None):
         'media_urls': media_urls
     }
 
-def cleanup_temp_files():
-    """Clean up temporary files older than 1 hour"""
+def send_media_refs(media_urls, media_refs, caption):
+    """Send media by URL or file_id in one API call, returning the sent messages"""
+    # Telegram counts every item of a media group toward the per-chat limit
+    telegram_bucket.take(len(media_urls))
+    if len(media_urls) == 1:
+        media = media_urls[0]
+        send = telegram_bot.send_photo if media['type'] == 'photo' else telegram_bot.send_video
+        return [send(TELEGRAM_CHAT_ID, media_refs[0], caption=caption, parse_mode='HTML')]
+    
+    media_group = [
+        (InputMediaPhoto if media['type'] == 'photo' else InputMediaVideo)(
+            media_ref, caption=caption if i == 0 else None, parse_mode='HTML'
+        )
+        for i, (media, media_ref) in enumerate(zip(media_urls, media_refs))
+    ]
+    return telegram_bot.send_media_group(TELEGRAM_CHAT_ID, media_group)
+
+def send_tweet_to_telegram(tweet):
+    """Send a processed tweet's media to Telegram, captioning the first item"""
+    caption = tweet['text']
+    media_urls = tweet['media_urls']
+    
+    # Let Telegram fetch the media itself: one API call per tweet, no bytes through us.
+    # Media sent before is referenced by its file_id instead of being fetched again.
+    media_refs = [file_id_cache.get(media_cache_key(media['url']), media['url']) for media in media_urls]
+    
     try:
-        now = time.time()
-        for filename in os.listdir(TEMP_DIR):
-            file_path = os.path.join(TEMP_DIR, filename)
-            if os.path.isfile(file_path) and now - os.path.getctime(file_path) > 3600:
-                os.remove(file_path)
+        try:
+            messages = send_media_refs(media_urls, media_refs, caption)
+        except ApiTelegramException as e:
+            if e.error_code != 429:
+                raise
+            # The tweet is already claimed, so wait out the flood limit and retry once
+            retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 60)
+            logger.warning("Telegram rate limit hit for tweet %s, retrying in %ss", tweet['id'], retry_after)
+            time.sleep(retry_after)
+            messages = send_media_refs(media_urls, media_refs, caption)
+    except ApiTelegramException as e:
+        # Only a 400 means the URL or file_id was rejected; anything else (429, 5xx)
+        # may have been delivered or will just fail again, so don't re-upload
+        if e.error_code != 400:
+            logger.error("Failed to send tweet %s to Telegram: %s", tweet['id'], e)
+            return
+        logger.warning("Telegram could not fetch media for tweet %s, uploading instead: %s", tweet['id'], e)
     except Exception as e:
-        logger.error(f"Error cleaning up temp files: {e}")
+        logger.error("Failed to send tweet %s to Telegram: %s", tweet['id'], e)
+        return
+    else:
+        logger.info("Successfully sent %d media for tweet: %s", len(media_urls), tweet['id'])
+        remember_file_ids(media_urls, messages)
+        return
+    
+    # Fall back to uploading each item, e.g. for videos above Telegram's URL size limit.
+    # Downloads run in parallel; uploads stay sequential so the captioned item comes first.
+    downloads = [media_executor.submit(download_media, media['url']) for media in media_urls]
+    
+    for i, (media, download) in enumerate(zip(media_urls, downloads)):
+        media_file = download.result()
+        if media_file is None:
+            continue
+        
+        is_photo = media['type'] == 'photo'
+        media_caption = caption if i == 0 else None
+        
+        with media_file:
+            message = send_media_to_telegram(media_file, caption=media_caption, is_photo=is_photo)
+        
+        if message:
+            logger.info("Successfully sent %s for tweet: %s", media['type'], tweet['id'])
+            remember_file_ids([media], [message])
+
+def forward_tweet(tweet_json):
+    """Forward a single streamed tweet payload (``data`` + ``includes``) to Telegram"""
+    tweet_id = tweet_json['data']['id']
+    try:
+        claimed = save_processed_tweets([tweet_id])
+    except Exception as e:
+        # Streamed tweets don't move the poll's since_id, so the next check retries it
+        logger.error("Could not claim tweet %s, leaving it for the next check: %s", tweet_id, e)
+        return False
+    
+    if not claimed:
+        logger.info("Skipping already processed tweet: %s", tweet_id)
+        return False
+    
+    tweet = process_tweet(tweet_json['data'], index_media(tweet_json))
+    if tweet:
+        send_tweet_to_telegram(tweet)
+    return tweet is not None
 
 def check_and_forward_tweets():
     """Check for new media tweets and forward them to Telegram"""
-    lock_file = os.path.join(DATA_DIR, 'bot.lock')
+    global TARGET_USER_ID, last_polled_id
+    
+    # Take the thread and file locks to prevent simultaneous execution
+    if not check_lock.acquire(blocking=False):
+        logger.info("Skipping check - another check is already running")
+        return 0
     
-    # Create file-based lock to prevent simultaneous execution
     try:
-        fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-        os.close(fd)
-    except FileExistsError:
+        fcntl.flock(check_lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        check_lock.release()
         logger.info("Skipping check - another process is already running")
         return 0
-    except Exception as e:
-        logger.error(f"Error creating lock file: {e}")
-        return 0
     
     try:
-        logger.info(f"Checking for new media tweets from @{TWITTER_TARGET_USER}...")
+        logger.info("Checking for new media tweets from @%s...", TWITTER_TARGET_USER)
         
-        processed_tweets = load_processed_tweets()
-        user_id = get_user_id(TWITTER_TARGET_USER)
+        if not TARGET_USER_ID:
+            TARGET_USER_ID = get_user_id(TWITTER_TARGET_USER)
+        user_id = TARGET_USER_ID
         
         if not user_id:
-            logger.error(f"Could not get user ID for @{TWITTER_TARGET_USER}")
+            logger.error("Could not get user ID for @%s", TWITTER_TARGET_USER)
             return 0
         
-        # Get the newest tweet ID to use as since_id
-        since_id = max(processed_tweets) if processed_tweets else None
+        # Only ask for tweets newer than the last poll; the first poll after a
+        # restart fetches the latest MAX_TWEETS_PER_CHECK and dedupes them below
+        since_id = str(last_polled_id) if last_polled_id else None
         
         # Get tweets (only new ones if since_id is available)
         tweets_data = get_recent_tweets(user_id, since_id)
@@ -290,53 +654,53 @@ def check_and_forward_tweets():
             logger.info("No new tweets found")
             return 0
         
-        new_tweets = []
-        newly_processed = set(processed_tweets)
+        newest_id = max(int(tweet['id']) for tweet in tweets_data['data'])
         
-        for tweet in tweets_data['data']:
-            if tweet['id'] not in processed_tweets:
-                processed_tweet = process_tweet(tweet, tweets_data)
-                if processed_tweet:
-                    new_tweets.append(processed_tweet)
-                newly_processed.add(tweet['id'])
+        # Bail out before any per-tweet work when everything was already handled
+        processed_tweets = load_processed_tweets(tweet['id'] for tweet in tweets_data['data'])
+        unseen_tweets = [tweet for tweet in tweets_data['data'] if tweet['id'] not in processed_tweets]
+        if not unseen_tweets:
+            last_polled_id = max(last_polled_id, newest_id)
+            logger.info("No new tweets found")
+            return 0
         
-        # Process tweets in chronological order (oldest first)
-        for tweet in reversed(new_tweets):
-            caption = tweet['text']
-            
-            for i, media in enumerate(tweet['media_urls']):
-                media_ext = '.mp4' if media['type'] == 'video' else '.jpg'
-                media_filename = os.path.join(TEMP_DIR, f"temp_{tweet['id']}_{i}{media_ext}")
-                
-                if download_media(media['url'], media_filename):
-                    is_photo = media['type'] == 'photo'
-                    media_caption = caption if i == 0 else None
-                    
-                    if send_media_to_telegram(media_filename, caption=media_caption, is_photo=is_photo):
-                        logger.info(f"Successfully sent {media['type']} for tweet: {tweet['id']}")
-                    
-                    try:
-                        os.remove(media_filename)
-                    except Exception as e:
-                        logger.warning(f"Could not remove temp file: {e}")
-                    
-                    time.sleep(1)
-            
-            time.sleep(2)
+        # Claim the IDs first; any the stream forwarded in the meantime drop out here.
+        # since_id only moves once the claim succeeds, so a failed claim is refetched.
+        claimed_ids = save_processed_tweets(tweet['id'] for tweet in unseen_tweets)
+        last_polled_id = max(last_polled_id, newest_id)
+        tweets_cache.clear()
         
-        if new_tweets:
-            save_processed_tweets(newly_processed)
+        new_tweets = deque()
+        media_by_key = index_media(tweets_data)
         
-        logger.info(f"Processing complete. Found {len(new_tweets)} new media tweets")
+        for tweet in unseen_tweets:
+            if tweet['id'] not in claimed_ids:
+                continue
+            processed_tweet = process_tweet(tweet, media_by_key)
+            if processed_tweet:
+                # The API returns newest first; prepending keeps new_tweets oldest first
+                new_tweets.appendleft(processed_tweet)
+        
+        # Process tweets in chronological order (oldest first)
+        for tweet in new_tweets:
+            send_tweet_to_telegram(tweet)
+        
+        logger.info("Processing complete. Found %d new media tweets", len(new_tweets))
         return len(new_tweets)
         
     finally:
-        # Always remove the lock file
-        try:
-            os.remove(lock_file)
-        except:
-            pass
-        cleanup_temp_files()
+        # Always release the locks
+        fcntl.flock(check_lock_fd, fcntl.LOCK_UN)
+        check_lock.release()
+
+init_processed_store()
+user_id_cache = load_user_id_cache()
+file_id_cache = load_file_id_cache()
+
+# Take the target account's ID from the persisted cache at startup, whatever its TTL
+# (user IDs never change). No network call here: a rate-limited lookup could stall
+# worker boot, so if nothing is cached the first check resolves it instead.
+TARGET_USER_ID = user_id_cache.get(TWITTER_TARGET_USER, (None,))[0]
 
 # Export for app.py to use
 if __name__ == "__main__":